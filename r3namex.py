@@ -8,12 +8,20 @@ License: BSD 3-Clause
 """
 
 import os
-import argparse
+import atexit
+import types
 import sys
 import json
+import errno
+import contextlib
+import functools
+import itertools
+import re
 import shutil
 import subprocess
 import tempfile
+import threading
+import uuid
 from datetime import datetime
 from pathlib import Path
 try:
@@ -22,7 +30,7 @@ try:
 except ImportError:
     urllib = None
 
-# Version info - MUST be before BANNER
+# Version info - MUST be before get_banner
 __author__ = "Fabian Peña (stuxboynet)"
 __version__ = "2.0.0"
 __license__ = "BSD 3-Clause"
@@ -30,8 +38,22 @@ __repo__ = "https://github.com/stuxboynet/r3namex"
 
 LOG_FILE = "logs.log"
 MAPPING_FILE = "backup_mapping.json"
+MAPPING_FORMATS = ("json", "pickle")
+DUPLICATE_STRATEGIES = ("skip", "suffix", "backup", "overwrite", "ask")
+# Above this many files the mapping is written as pickle unless a format is given
+PICKLE_MAPPING_THRESHOLD = 10000
+# The mapping is streamed during the batch and fsynced once when it is closed
+_MAPPING_BUFFER_SIZE = 1 << 16
 
-BANNER = """
+# __version__ sits at the top of the script, so the update check only fetches the first bytes
+_VERSION_PROBE_BYTES = 2048
+_VERSION_RE = re.compile(rb'^__version__\s*=\s*"([^"]+)"', re.M)
+
+
+@functools.lru_cache(maxsize=None)
+def get_banner():
+    """ASCII banner, built only when it is displayed"""
+    return """
   _____  ____                            __   __ 
  |  __ \|___ \                           \ \ / / 
  | |__) | __) |_ __   __ _ _ __ ___   ___ \ V /  
@@ -42,7 +64,11 @@ BANNER = """
         Created by Fabian Peña (stuxboynet)
                     Version """ + __version__
 
-EXAMPLES = """
+
+@functools.lru_cache(maxsize=None)
+def get_examples():
+    """Usage examples shown at the end of the help text"""
+    return """
 EXAMPLES:
 
 To rename and enumerate all files:
@@ -68,6 +94,36 @@ To handle duplicates:
 """
 
 
+@functools.lru_cache(maxsize=None)
+def get_help_text(description):
+    """Full help text, written to stdout in a single call"""
+    return "\n".join([
+        get_banner(),
+        "\n" + description + "\n",
+        "Usage: r3namex.py [-h] [-v] [-u] [-l LOCATION] [-p PREFIX] [-a] [-cs CURRENT_START]",
+        "                  [-ce CURRENT_END] [-ns NEW_START] [-r]",
+        "                  [-ds {skip,suffix,backup,overwrite,ask}] [-mf {json,pickle}]\n",
+        "Options:",
+        "  -h, --help            Show this help message and exit",
+        "  -v, --version         Show version information",
+        "  -u, --update          Check for updates",
+        "  -l, --location        Folder where files are located",
+        "  -p, --prefix          Prefix of files (optional)",
+        "  -a, --all             Interactive rename for all files in directory and subfolders",
+        "  -cs, --current-start  Start of current range",
+        "  -ce, --current-end    End of current range",
+        "  -ns, --new-start      New start point for renaming",
+        "  -r, --rollback        Revert last renaming operation",
+        "  -ds, --duplicate-strategy",
+        "                        How to handle duplicate filenames (default: ask)",
+        "                        Choices: skip, suffix, backup, overwrite, ask",
+        "  -mf, --mapping-format",
+        "                        Format of the rollback mapping file",
+        f"                        (default: json, pickle above {PICKLE_MAPPING_THRESHOLD} files)",
+        get_examples(),
+    ]) + "\n"
+
+
 def check_for_updates():
     """Check GitHub for newer version"""
     if urllib is None:
@@ -78,18 +134,17 @@ def check_for_updates():
         print("Checking for updates...")
         url = f"{__repo__}/raw/main/r3namex.py"
         
-        # Get remote version
-        response = urllib.request.urlopen(url, timeout=5)
-        content = response.read().decode('utf-8')
+        # Get remote version (only the first bytes of the file)
+        request = urllib.request.Request(url, headers={'Range': f'bytes=0-{_VERSION_PROBE_BYTES - 1}'})
+        response = urllib.request.urlopen(request, timeout=5)
+        content = response.read(_VERSION_PROBE_BYTES)
         
         # Extract version from remote file
-        for line in content.split('\n'):
-            if line.startswith('__version__') and '=' in line:
-                remote_version = line.split('"')[1]
-                break
-        else:
+        match = _VERSION_RE.search(content)
+        if not match:
             print("Could not determine remote version")
             return
+        remote_version = match.group(1).decode('utf-8')
         
         # Compare versions
         current = tuple(map(int, __version__.split('.')))
@@ -116,19 +171,28 @@ def update_script(url):
     try:
         print("Downloading new version...")
         
-        # Download to temporary file
-        with tempfile.NamedTemporaryFile(mode='wb', delete=False) as tmp:
+        current_script = os.path.abspath(sys.argv[0])
+        
+        # Download to a temporary file next to the script, so the final
+        # replace is a rename on the same filesystem
+        with tempfile.NamedTemporaryFile(mode='wb', delete=False,
+                                         dir=os.path.dirname(current_script)) as tmp:
             response = urllib.request.urlopen(url)
             tmp.write(response.read())
             tmp_path = tmp.name
         
-        # Backup current script
-        current_script = os.path.abspath(sys.argv[0])
+        # Backup current script: a hard link avoids copying the data, with a
+        # full copy as fallback where links are not supported
         backup_path = current_script + '.backup'
-        shutil.copy2(current_script, backup_path)
+        try:
+            if os.path.lexists(backup_path):
+                os.remove(backup_path)
+            os.link(current_script, backup_path)
+        except OSError:
+            shutil.copy2(current_script, backup_path)
         
-        # Replace with new version
-        shutil.move(tmp_path, current_script)
+        # Replace with new version (a new file, the backup link keeps the old one)
+        os.replace(tmp_path, current_script)
         
         # Make executable on Unix-like systems
         if os.name != 'nt':
@@ -144,9 +208,56 @@ def update_script(url):
             os.remove(tmp_path)
 
 
+_AT_FDCWD = -100
+_RENAME_NOREPLACE = 1
+_renameat2 = None
+
+
+def _load_renameat2():
+    """Carga renameat2 de libc (Linux) o devuelve False si no está disponible"""
+    global _renameat2
+    if _renameat2 is None:
+        _renameat2 = False
+        if sys.platform.startswith("linux"):
+            try:
+                import ctypes
+                libc = ctypes.CDLL(None, use_errno=True)
+                func = libc.renameat2
+                func.argtypes = [ctypes.c_int, ctypes.c_char_p,
+                                 ctypes.c_int, ctypes.c_char_p, ctypes.c_uint]
+                func.restype = ctypes.c_int
+                _renameat2 = (func, ctypes.get_errno)
+            except (OSError, AttributeError):
+                pass
+    return _renameat2
+
+
+def _rename_noreplace(src, dst):
+    """Renombra src a dst; lanza FileExistsError si dst ya existe"""
+    if os.name == "nt":
+        # En Windows os.rename ya falla si el destino existe
+        os.rename(src, dst)
+        return
+    
+    renameat2 = _load_renameat2()
+    if renameat2:
+        func, get_errno = renameat2
+        if func(_AT_FDCWD, os.fsencode(src), _AT_FDCWD, os.fsencode(dst), _RENAME_NOREPLACE) == 0:
+            return
+        err = get_errno()
+        # ENOSYS/EINVAL: kernel o sistema de archivos sin soporte, usar el método clásico
+        if err not in (errno.ENOSYS, errno.EINVAL):
+            raise OSError(err, os.strerror(err), src, None, dst)
+    
+    # En POSIX os.rename sobrescribe silenciosamente, hay que comprobar antes
+    if os.path.lexists(dst):
+        raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), dst)
+    os.rename(src, dst)
+
+
 def show_version():
     """Display version information"""
-    print(f"""{BANNER}
+    print(f"""{get_banner()}
 
 R3nameX - Batch File Renaming Tool
 Version: {__version__}
@@ -161,12 +272,13 @@ Platform: {sys.platform}
 
 class RenameOperation:
     """Clase para representar una operación de renombrado"""
-    def __init__(self, old_path, new_path, operation_type="rename"):
-        self.old_path = os.path.abspath(old_path)
-        self.new_path = os.path.abspath(new_path)
-        self.operation_type = operation_type  # "rename", "backup", "overwrite"
+    def __init__(self, old_path, new_path, operation_type="rename", timestamp=None):
+        # Los llamadores ya pasan rutas absolutas; abspath solo para las relativas
+        self.old_path = old_path if os.path.isabs(old_path) else os.path.abspath(old_path)
+        self.new_path = new_path if os.path.isabs(new_path) else os.path.abspath(new_path)
+        self.operation_type = operation_type  # "rename", "backup", "overwrite", "temp"
         self.backup_path = None
-        self.timestamp = datetime.now().isoformat()
+        self.timestamp = timestamp or datetime.now().isoformat()
     
     def to_dict(self):
         return {
@@ -179,28 +291,81 @@ class RenameOperation:
     
     @classmethod
     def from_dict(cls, data):
-        op = cls(data["old_path"], data["new_path"], data["operation_type"])
+        op = cls(data["old_path"], data["new_path"], data["operation_type"], data.get("timestamp"))
         op.backup_path = data.get("backup_path")
-        op.timestamp = data.get("timestamp")
         return op
 
 
+@functools.lru_cache(maxsize=None)
+def _mapping_unpickler_class():
+    """Unpickler que solo acepta tipos básicos (el mapeo no contiene clases)
+    
+    pickle solo se importa cuando se usa el formato pickle.
+    """
+    import pickle
+    
+    class MappingUnpickler(pickle.Unpickler):
+        def find_class(self, module, name):
+            raise pickle.UnpicklingError(f"Unexpected object in mapping file: {module}.{name}")
+    
+    return MappingUnpickler
+
+
 class DuplicateHandler:
     """Maneja archivos duplicados con soporte completo de rollback"""
     
-    def __init__(self, strategy="ask", backup_dir=".rename_backups"):
+    def __init__(self, strategy="ask", backup_dir=".rename_backups", mapping_file=MAPPING_FILE,
+                 mapping_format="json"):
         self.strategy = strategy
         self.backup_dir = backup_dir
-        self.operations = []
+        self.mapping_file = mapping_file
+        self.mapping_format = mapping_format  # "json" (NDJSON) o "pickle"
+        self.operation_count = 0
+        now = datetime.now()
+        self.timestamp = now.isoformat()  # compartido por todas las operaciones del lote
+        # Los nombres de backup combinan la hora del lote con un contador propio
+        self._batch_ts = now.strftime("%Y%m%d_%H%M%S_%f")
+        self._backup_counter = itertools.count()
+        self._mapping_fh = None
+        self._lock = threading.Lock()
+        self._temp_names = {}  # nombre temporal -> nombre original (para mensajes)
+    
+    def _record(self, op):
+        """Escribe la operación en el mapeo en cuanto se completa"""
+        with self._lock:
+            self._write_operation(op)
+    
+    def _write_operation(self, op):
+        if self._mapping_fh is None:
+            # El mapeo anterior solo se reemplaza cuando hay una operación nueva
+            binary = self.mapping_format == "pickle"
+            self._mapping_fh = open(self.mapping_file, "wb" if binary else "w",
+                                    buffering=_MAPPING_BUFFER_SIZE)
+            self._write_record({
+                "version": "2.1",  # Versión del formato para compatibilidad futura
+                "timestamp": self.timestamp
+            })
+        self._write_record(op.to_dict())
+        self.operation_count += 1
+    
+    def _write_record(self, record):
+        if self.mapping_format == "pickle":
+            import pickle
+            pickle.dump(record, self._mapping_fh, protocol=pickle.HIGHEST_PROTOCOL)
+        else:
+            self._mapping_fh.write(json.dumps(record, separators=(',', ':')) + "\n")
     
     def handle_duplicate(self, old_path, new_path):
         """Maneja un caso de duplicado y registra la operación para rollback"""
         
-        # Si no hay conflicto, es un renombrado simple
-        if not os.path.exists(new_path):
-            os.rename(old_path, new_path)
-            op = RenameOperation(old_path, new_path, "rename")
-            self.operations.append(op)
+        # Intentar el renombrado directamente; solo hay conflicto si falla
+        try:
+            _rename_noreplace(old_path, new_path)
+        except FileExistsError:
+            pass
+        else:
+            op = RenameOperation(old_path, new_path, "rename", self.timestamp)
+            self._record(op)
             return new_path
         
         # Si son el mismo archivo, no hacer nada
@@ -219,81 +384,112 @@ class DuplicateHandler:
         else:  # ask
             return self._handle_ask(old_path, new_path)
     
+    def move_to_temp(self, old_path):
+        """Mueve el archivo a un nombre temporal único en su misma carpeta"""
+        directory, filename = os.path.split(old_path)
+        temp_path = os.path.join(directory, f".r3nx_{uuid.uuid4().hex}{os.path.splitext(filename)[1]}")
+        os.rename(old_path, temp_path)
+        self._record(RenameOperation(old_path, temp_path, "temp", self.timestamp))
+        self._temp_names[temp_path] = filename
+        return temp_path
+    
+    def restore_from_temp(self, temp_path, old_path):
+        """Devuelve a su nombre original un archivo que quedó con nombre temporal"""
+        try:
+            _rename_noreplace(temp_path, old_path)
+        except FileExistsError:
+            # El nombre original se ocupó mientras tanto: el archivo queda con su
+            # nombre temporal (registrado en el mapeo, -r lo recupera)
+            print(f"  [WARNING] {os.path.basename(old_path)} kept the temporary name "
+                  f"{os.path.basename(temp_path)} (use -r to restore it)")
+            return temp_path
+        self._record(RenameOperation(temp_path, old_path, "temp", self.timestamp))
+        return old_path
+    
+    def _display_name(self, path):
+        """Nombre a mostrar para un archivo, aunque esté con nombre temporal"""
+        return self._temp_names.get(path) or os.path.basename(path)
+    
     def _handle_skip(self, old_path, new_path):
         """Omite el archivo si ya existe el destino"""
-        print(f"  [SKIP] {os.path.basename(old_path)} (destination already exists)")
+        print(f"  [SKIP] {self._display_name(old_path)} (destination already exists)")
         # No se registra operación porque no se hizo nada
         return old_path
     
     def _handle_suffix(self, old_path, new_path):
         """Agrega sufijo numérico para evitar colisión"""
-        directory = os.path.dirname(new_path)
-        filename = os.path.basename(new_path)
+        directory, filename = os.path.split(new_path)
         name, ext = os.path.splitext(filename)
+        dir_prefix = os.path.join(directory, "")
         
-        # Encontrar nombre disponible
+        # Probar sufijos hasta que el renombrado no choque con un archivo existente
         counter = 1
-        original_new_path = new_path
-        while os.path.exists(new_path):
+        while True:
             new_filename = f"{name}_{counter}{ext}"
-            new_path = os.path.join(directory, new_filename)
-            counter += 1
+            new_path = dir_prefix + new_filename
+            try:
+                _rename_noreplace(old_path, new_path)
+                break
+            except FileExistsError:
+                counter += 1
         
-        os.rename(old_path, new_path)
-        op = RenameOperation(old_path, new_path, "rename")
-        self.operations.append(op)
+        op = RenameOperation(old_path, new_path, "rename", self.timestamp)
+        self._record(op)
         
-        print(f"  [RENAMED] {os.path.basename(old_path)} -> {os.path.basename(new_path)}")
+        print(f"  [RENAMED] {self._display_name(old_path)} -> {new_filename}")
         return new_path
     
     def _handle_backup(self, old_path, new_path):
         """Hace backup del archivo existente antes de renombrar"""
+        directory, new_name = os.path.split(new_path)
+        
         # Crear directorio de backup
-        backup_dir = os.path.join(os.path.dirname(new_path), self.backup_dir)
+        backup_dir = os.path.join(directory, self.backup_dir)
         os.makedirs(backup_dir, exist_ok=True)
         
         # Generar nombre de backup único
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
-        backup_name = f"{os.path.basename(new_path)}.{timestamp}.backup"
+        backup_name = f"{new_name}.{self._batch_ts}_{next(self._backup_counter):06d}.backup"
         backup_path = os.path.join(backup_dir, backup_name)
         
-        # Mover archivo existente a backup
-        shutil.move(new_path, backup_path)
+        # Mover archivo existente a backup; backup_dir cuelga de la misma carpeta,
+        # así que es el mismo sistema de archivos y basta un rename atómico
+        os.replace(new_path, backup_path)
         
         # Renombrar archivo original
         os.rename(old_path, new_path)
         
         # Registrar operación compleja
-        op = RenameOperation(old_path, new_path, "backup")
+        op = RenameOperation(old_path, new_path, "backup", self.timestamp)
         op.backup_path = backup_path
-        self.operations.append(op)
+        self._record(op)
         
-        print(f"  [BACKUP] {os.path.basename(new_path)} -> {backup_name}")
-        print(f"  [RENAMED] {os.path.basename(old_path)} -> {os.path.basename(new_path)}")
+        print(f"  [BACKUP] {new_name} -> {backup_name}")
+        print(f"  [RENAMED] {self._display_name(old_path)} -> {new_name}")
         return new_path
     
     def _handle_overwrite(self, old_path, new_path):
         """Sobrescribe el archivo existente (con backup oculto para rollback)"""
+        directory, new_name = os.path.split(new_path)
+        
         # Crear backup oculto para poder hacer rollback
-        backup_dir = os.path.join(os.path.dirname(new_path), self.backup_dir, "overwritten")
+        backup_dir = os.path.join(directory, self.backup_dir, "overwritten")
         os.makedirs(backup_dir, exist_ok=True)
         
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
-        backup_name = f"{os.path.basename(new_path)}.{timestamp}.overwritten"
+        backup_name = f"{new_name}.{self._batch_ts}_{next(self._backup_counter):06d}.overwritten"
         backup_path = os.path.join(backup_dir, backup_name)
         
-        # Mover el archivo que será sobrescrito al backup
-        shutil.move(new_path, backup_path)
+        # Mover el archivo que será sobrescrito al backup (mismo sistema de archivos)
+        os.replace(new_path, backup_path)
         
         # Renombrar
-        os.rename(old_path, new_path)
+        os.replace(old_path, new_path)
         
         # Registrar operación
-        op = RenameOperation(old_path, new_path, "overwrite")
+        op = RenameOperation(old_path, new_path, "overwrite", self.timestamp)
         op.backup_path = backup_path
-        self.operations.append(op)
+        self._record(op)
         
-        print(f"  [OVERWRITE] {os.path.basename(new_path)}")
+        print(f"  [OVERWRITE] {new_name}")
         return new_path
     
     def _handle_ask(self, old_path, new_path):
@@ -319,40 +515,318 @@ class DuplicateHandler:
             else:
                 print("Invalid option. Please choose 1-4.")
     
-    def save_operations(self, mapping_file):
-        """Guarda las operaciones para rollback"""
-        data = {
-            "version": "2.0",  # Versión del formato para compatibilidad futura
-            "timestamp": datetime.now().isoformat(),
-            "operations": [op.to_dict() for op in self.operations]
-        }
+    def save_operations(self):
+        """Cierra el mapeo de operaciones para rollback
         
-        with open(mapping_file, "w") as f:
-            json.dump(data, f, indent=2)
+        El mapeo se sincroniza con el disco una sola vez, al final del lote.
+        """
+        if self._mapping_fh is not None:
+            try:
+                self._mapping_fh.flush()
+                os.fsync(self._mapping_fh.fileno())
+            finally:
+                self._mapping_fh.close()
+                self._mapping_fh = None
+    
+    @staticmethod
+    def load_operations(mapping_file):
+        """Lee un mapeo y devuelve (timestamp, operaciones)"""
+        with open(mapping_file, "rb") as f:
+            # Los pickle (protocolo 2 o superior) empiezan con el byte PROTO
+            if f.read(1) == b"\x80":
+                import pickle
+                f.seek(0)
+                unpickler = _mapping_unpickler_class()(f)
+                header = unpickler.load()
+                operations = []
+                while True:
+                    try:
+                        operations.append(RenameOperation.from_dict(unpickler.load()))
+                    except EOFError:
+                        break
+                    except (pickle.UnpicklingError, ValueError, AttributeError, IndexError):
+                        # Un último registro a medio escribir (el proceso se cortó)
+                        # marca el final; las operaciones anteriores se conservan
+                        if f.read(1):
+                            raise
+                        break
+                return header["timestamp"], operations
+        
+        with open(mapping_file, "r") as f:
+            content = f.read()
+        
+        first_line, _, rest = content.partition("\n")
+        try:
+            header = json.loads(first_line)
+        except ValueError:
+            header = None
+        
+        # Formato 2.0: un único documento JSON con la lista de operaciones
+        if header is None or "operations" in header:
+            data = json.loads(content)
+            return data["timestamp"], [RenameOperation.from_dict(op) for op in data["operations"]]
+        
+        # Las líneas NDJSON se decodifican juntas como una sola lista JSON;
+        # la última va aparte porque puede haber quedado a medio escribir
+        lines = rest.split("\n")
+        tail = lines.pop()
+        records = json.loads("[" + ",".join(line for line in lines if line.strip()) + "]")
+        if tail.strip():
+            try:
+                records.append(json.loads(tail))
+            except ValueError:
+                pass
+        return header["timestamp"], [RenameOperation.from_dict(record) for record in records]
 
 
-def check_write_permissions(directory):
-    if not os.access(directory, os.W_OK):
-        print(f"Error: You do not have write permissions in {directory}.")
-        log_action(f"You do not have write permissions in {directory}.")
-        sys.exit(1)
+def write_permission_error(directory):
+    """Informa de que no se puede escribir en la carpeta y termina"""
+    print(f"Error: You do not have write permissions in {directory}.")
+    log_action(f"You do not have write permissions in {directory}.")
+    sys.exit(1)
+
+
+_log_fd = None
+_log_batching = False
+_log_buffer = []
+_LOG_BATCH_SIZE = 100
+# Marca de tiempo del log ya formateada para el segundo actual
+_log_stamp = (None, "")
+
+
+def _close_log():
+    """Escribe lo pendiente y cierra el descriptor del log al salir"""
+    global _log_fd
+    try:
+        flush_log()
+    finally:
+        os.close(_log_fd)
+        _log_fd = None
+
+
+def _write_log(text):
+    """Añade texto al log con un descriptor O_APPEND abierto una vez por proceso"""
+    global _log_fd
+    if _log_fd is None:
+        _log_fd = os.open(LOG_FILE, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        atexit.register(_close_log)
+    data = memoryview(text.encode("utf-8"))
+    while data:
+        data = data[os.write(_log_fd, data):]
+
+
+def begin_log_batch():
+    """Acumula las entradas del log durante una operación"""
+    global _log_batching
+    _log_batching = True
+
+
+def flush_log():
+    """Escribe en disco las entradas pendientes del log"""
+    if _log_buffer:
+        _write_log("".join(_log_buffer))
+        _log_buffer.clear()
+
+
+def end_log_batch():
+    """Escribe las entradas pendientes y vuelve a escribir cada entrada al momento"""
+    global _log_batching
+    flush_log()
+    _log_batching = False
+
+
+def _log_timestamp():
+    """Devuelve la marca de tiempo del log, formateándola una vez por segundo"""
+    global _log_stamp
+    now = datetime.now().replace(microsecond=0)
+    if _log_stamp[0] != now:
+        _log_stamp = (now, now.strftime('%Y-%m-%d %H:%M:%S'))
+    return _log_stamp[1]
 
 
 def log_action(message, command=None):
-    with open(LOG_FILE, "a") as log:
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        cmd_info = f"Command: {command}\n" if command else ""
-        log.write(f"{timestamp} - {cmd_info}{message}\n")
+    timestamp = _log_timestamp()
+    cmd_info = f"Command: {command}\n" if command else ""
+    entry = f"{timestamp} - {cmd_info}{message}\n"
+    
+    # Fuera de una operación por lotes se escribe directamente
+    if not _log_batching:
+        _write_log(entry)
+        return
+    
+    _log_buffer.append(entry)
+    if len(_log_buffer) >= _LOG_BATCH_SIZE:
+        flush_log()
+
+
+_MAX_RENAME_WORKERS = 32
+# Con pocos pasos crear los hilos cuesta más que los renombrados en sí
+_MIN_PARALLEL_STEPS = 8
+
+# Lectura de carpetas a través de descriptores abiertos (POSIX, Python 3.7+)
+_SCANDIR_FD = (os.scandir in os.supports_fd and os.open in os.supports_dir_fd
+               and hasattr(os, "O_DIRECTORY"))
 
 
-def rename_all_files_interactive(directory, prefix=None, start_number=1, duplicate_strategy="ask"):
+@contextlib.contextmanager
+def opened_folder(path, dir_fd=None):
+    """Abre una carpeta como descriptor (None si el sistema no lo soporta)
+    
+    Con dir_fd la carpeta se abre por su nombre relativo a ese descriptor, así
+    la recursión no vuelve a resolver la ruta completa en cada llamada.
+    """
+    if not _SCANDIR_FD:
+        yield None
+        return
+    name = os.path.basename(path) if dir_fd is not None else path
+    fd = os.open(name, os.O_RDONLY | os.O_DIRECTORY, dir_fd=dir_fd)
+    try:
+        yield fd
+    finally:
+        os.close(fd)
+
+
+def run_rename_plan(handler, plan, existing=None):
+    """Ejecuta un plan de renombrado [(old_path, new_path, message), ...]
+    
+    message se muestra antes de cada paso (None para no mostrar nada).
+    existing es el conjunto de rutas de la carpeta (con os.path.normcase) si
+    quien llama ya lo tiene; si no, los destinos se comprueban en disco.
+    
+    Devuelve la ruta resultante de cada paso en el mismo orden del plan. Si
+    algún destino es el origen de otro paso, el plan se hace en dos fases
+    (origen -> nombre temporal -> destino) para que el lote nunca choque
+    consigo mismo. Los pasos de cada fase son independientes entre sí, así
+    que se lanzan en paralelo salvo que la estrategia pregunte al usuario o
+    que sean muy pocos.
+    """
+    def run_step(step):
+        old_path, new_path, message = step
+        if message:
+            # Una sola escritura por línea: los hilos no intercalan el texto
+            sys.stdout.write(message + "\n")
+        return handler.handle_duplicate(old_path, new_path)
+    
+    def run_steps(func, steps, keep_going=False):
+        """Ejecuta los pasos y devuelve (resultados, primer error)
+        
+        Un fallo no hace perder los resultados de los demás pasos: los pasos
+        fallidos (o que ya no se lanzaron) quedan como None. En serie se para
+        en el primer fallo salvo con keep_going.
+        """
+        results = [None] * len(steps)
+        errors = []
+        
+        def attempt(i):
+            try:
+                results[i] = func(steps[i])
+            except Exception as e:
+                errors.append(e)
+        
+        if handler.strategy == "ask" or len(steps) < _MIN_PARALLEL_STEPS:
+            for i in range(len(steps)):
+                attempt(i)
+                if errors and not keep_going:
+                    break
+        else:
+            # concurrent.futures solo se importa cuando se usa el pool (carga logging)
+            from concurrent.futures import ThreadPoolExecutor
+            with ThreadPoolExecutor(max_workers=min(_MAX_RENAME_WORKERS, len(steps))) as executor:
+                list(executor.map(attempt, range(len(steps))))
+        return results, (errors[0] if errors else None)
+    
+    def run_steps_or_raise(func, steps):
+        results, error = run_steps(func, steps)
+        if error is not None:
+            raise error
+        return results
+    
+    def recover(steps, temp_paths, results):
+        """Tras un fallo, devuelve a su nombre original lo que quedó con nombre temporal"""
+        for (old_path, _, _), temp_path, result_path in zip(steps, temp_paths, results):
+            if temp_path is None or result_path not in (None, temp_path):
+                continue
+            try:
+                handler.restore_from_temp(temp_path, old_path)
+            except OSError as e:
+                print(f"  [WARNING] {os.path.basename(old_path)} kept the temporary name "
+                      f"{os.path.basename(temp_path)} ({e}; use -r to restore it)")
+    
+    def overlaps(steps, sources):
+        return any(os.path.normcase(new_path) in sources and new_path != old_path
+                   for old_path, new_path, _ in steps)
+    
+    sources = {os.path.normcase(old_path) for old_path, _, _ in plan}
+    if not overlaps(plan, sources):
+        return run_steps_or_raise(run_step, plan)
+    
+    # Los destinos ocupados por archivos ajenos al lote se resuelven con la
+    # estrategia antes de mover nada a nombres temporales. Un archivo que se
+    # queda en su sitio (skip) bloquea a su vez al paso que iba a ocupar su
+    # nombre, así que se repite hasta que no quedan conflictos
+    occupied = set(existing) if existing is not None else None
+    
+    def is_occupied(path):
+        if occupied is None:
+            return os.path.lexists(path)
+        return os.path.normcase(path) in occupied
+    
+    results = [None] * len(plan)
+    pending = list(range(len(plan)))
+    while True:
+        conflicts = [i for i in pending
+                     if os.path.normcase(plan[i][1]) not in sources and is_occupied(plan[i][1])]
+        if not conflicts:
+            break
+        for i, result_path in zip(conflicts, run_steps_or_raise(run_step, [plan[i] for i in conflicts])):
+            old_path = plan[i][0]
+            results[i] = result_path
+            sources.discard(os.path.normcase(old_path))
+            if occupied is not None and result_path != old_path:
+                occupied.discard(os.path.normcase(old_path))
+                occupied.add(os.path.normcase(result_path))
+        pending = [i for i in pending if results[i] is None]
+    
+    steps = [plan[i] for i in pending]
+    if not overlaps(steps, sources):
+        step_results = run_steps_or_raise(run_step, steps)
+    else:
+        # Si una fase falla, lo que quedó con nombre temporal vuelve a su nombre
+        # original antes de propagar el error (o se avisa de que -r lo recupera)
+        temp_paths, error = run_steps(handler.move_to_temp, [old_path for old_path, _, _ in steps])
+        if error is not None:
+            recover(steps, temp_paths, [None] * len(steps))
+            raise error
+        
+        # Con los conflictos externos resueltos la segunda fase no puede chocar;
+        # si un paso falla los demás siguen, para dejar ocultos los menos posibles
+        step_results, error = run_steps(run_step, [(temp_path, new_path, message)
+                                                   for temp_path, (_, new_path, message)
+                                                   in zip(temp_paths, steps)], keep_going=True)
+        if error is not None:
+            recover(steps, temp_paths, step_results)
+            raise error
+        
+        # Por si algo cambió en la carpeta entre tanto, lo que no llegó a su
+        # destino recupera su nombre original
+        step_results = [handler.restore_from_temp(temp_path, old_path) if result_path == temp_path
+                        else result_path
+                        for (old_path, _, _), temp_path, result_path in zip(steps, temp_paths, step_results)]
+    
+    for i, result_path in zip(pending, step_results):
+        results[i] = result_path
+    return results
+
+
+def rename_all_files_interactive(directory, prefix=None, start_number=1, duplicate_strategy="ask",
+                                 mapping_format=None):
+    begin_log_batch()
+    handler = None
     try:
         directory = os.path.abspath(directory)
         if not os.path.exists(directory):
             print(f"Error: The directory '{directory}' does not exist.")
             return
-
-        check_write_permissions(directory)
         
         print("\n" + "="*60)
         print("INTERACTIVE RENAME MODE")
@@ -360,16 +834,30 @@ def rename_all_files_interactive(directory, prefix=None, start_number=1, duplica
         print(f"Base directory: {directory}")
         print("="*60)
         
-        handler = DuplicateHandler(duplicate_strategy)
+        # El total de archivos no se conoce de antemano: JSON salvo que se pida otro formato
+        handler = DuplicateHandler(duplicate_strategy, mapping_format=mapping_format or "json")
         total_files_renamed = 0
         
-        # Función recursiva para procesar carpetas nivel por nivel
-        def process_folder_level(current_path, current_prefix, current_start):
+        def scan_folder(path, fd=None):
+            """Lee la carpeta una sola vez y separa nombres de archivos y subcarpetas"""
+            files = []
+            subdirs = []
+            with os.scandir(path if fd is None else fd) as it:
+                for entry in it:
+                    if entry.is_file():
+                        files.append(entry.name)
+                    elif entry.is_dir():
+                        subdirs.append(entry.name)
+            return files, subdirs
+        
+        # Función recursiva para procesar carpetas nivel por nivel; listing es el
+        # resultado de scan_folder si la carpeta ya se leyó al contar sus archivos
+        # y dir_fd el descriptor abierto de la carpeta (ver opened_folder)
+        def process_folder_level(current_path, current_prefix, current_start, listing=None, dir_fd=None):
             nonlocal total_files_renamed
             
-            # Obtener archivos en la carpeta actual (sin subcarpetas)
-            files = [f for f in os.listdir(current_path) 
-                    if os.path.isfile(os.path.join(current_path, f))]
+            # Obtener archivos y subcarpetas de la carpeta actual
+            files, subdirs = listing or scan_folder(current_path, dir_fd)
             
             if files:
                 # Mostrar información de la carpeta actual
@@ -406,37 +894,42 @@ def rename_all_files_interactive(directory, prefix=None, start_number=1, duplica
                 print("-" * 50)
                 
                 # Renombrar los archivos
-                for i, file in enumerate(sorted(files)):
-                    old_path = os.path.join(current_path, file)
-                    extension = os.path.splitext(file)[1]
-                    new_filename = f"{folder_prefix}{folder_start_number + i}{extension}"
-                    new_path = os.path.join(current_path, new_filename)
-                    
-                    print(f"  {file:<30} -> {new_filename}")
-                    
-                    result_path = handler.handle_duplicate(old_path, new_path)
+                dir_prefix = os.path.join(current_path, "")
+                plan = []
+                for number, file in enumerate(sorted(files), folder_start_number):
+                    new_filename = f"{folder_prefix}{number}{os.path.splitext(file)[1]}"
+                    plan.append((dir_prefix + file, dir_prefix + new_filename,
+                                 f"  {file:<30} -> {new_filename}"))
+                
+                # Sin comprobación previa: el propio renombrado indica si falta permiso
+                try:
+                    results = run_rename_plan(handler, plan)
+                except PermissionError:
+                    write_permission_error(current_path)
+                
+                for (old_path, _, _), result_path in zip(plan, results):
                     if result_path != old_path:
                         total_files_renamed += 1
                 
                 print("-" * 50)
                 print(f"Finished processing this folder.")
             
-            # Después de procesar los archivos, buscar subcarpetas
-            subdirs = [d for d in os.listdir(current_path) 
-                      if os.path.isdir(os.path.join(current_path, d))]
-            
+            # Después de procesar los archivos, revisar las subcarpetas
             if subdirs:
-                # Contar archivos en cada subcarpeta
+                # Contar archivos en cada subcarpeta; el listado se guarda para
+                # no volver a leerla si el usuario decide procesarla
                 subfolders_info = []
                 for subdir in subdirs:
                     subdir_path = os.path.join(current_path, subdir)
-                    file_count = len([f for f in os.listdir(subdir_path) 
-                                    if os.path.isfile(os.path.join(subdir_path, f))])
+                    with opened_folder(subdir_path, dir_fd) as subdir_fd:
+                        subdir_listing = scan_folder(subdir_path, subdir_fd)
+                    file_count = len(subdir_listing[0])
                     if file_count > 0:  # Solo mostrar subcarpetas con archivos
                         subfolders_info.append({
                             'name': subdir,
                             'path': subdir_path,
-                            'count': file_count
+                            'count': file_count,
+                            'listing': subdir_listing
                         })
                 
                 if subfolders_info:
@@ -471,14 +964,17 @@ def rename_all_files_interactive(directory, prefix=None, start_number=1, duplica
                         
                         # Procesar las subcarpetas seleccionadas recursivamente
                         for folder_info in selected_folders:
-                            process_folder_level(folder_info['path'], None, 1)
+                            with opened_folder(folder_info['path'], dir_fd) as subdir_fd:
+                                process_folder_level(folder_info['path'], None, 1,
+                                                     folder_info['listing'], subdir_fd)
         
         # Iniciar el procesamiento desde la carpeta principal
-        process_folder_level(directory, prefix, start_number)
+        with opened_folder(directory) as root_fd:
+            process_folder_level(directory, prefix, start_number, dir_fd=root_fd)
         
         # Guardar operaciones para rollback
-        if handler.operations:
-            handler.save_operations(MAPPING_FILE)
+        if handler.operation_count:
+            handler.save_operations()
             print(f"\n" + "="*60)
             print(f"OPERATION COMPLETED!")
             print(f"Summary:")
@@ -493,23 +989,43 @@ def rename_all_files_interactive(directory, prefix=None, start_number=1, duplica
     except Exception as e:
         print(f"\nError: {e}")
         log_action(f"Rename error: {e}")
+    
+    finally:
+        # Cerrar el mapeo también si la operación se interrumpió a medias
+        if handler is not None:
+            handler.save_operations()
+        end_log_batch()
 
 
-def rename_files(directory, prefix, current_start, current_end, new_start, duplicate_strategy="ask"):
+def rename_files(directory, prefix, current_start, current_end, new_start, duplicate_strategy="ask",
+                 mapping_format=None):
+    begin_log_batch()
+    handler = None
     try:
-        check_write_permissions(directory)
+        directory = os.path.abspath(directory)
         
-        # Listar los archivos en la carpeta
-        files = sorted(os.listdir(directory))
+        # Listar los archivos en la carpeta (una sola lectura del directorio)
+        with os.scandir(directory) as it:
+            entries = {entry.name: entry for entry in it}
         
-        if not files:
+        if not entries:
             print(f"Warning: The directory '{directory}' is empty.")
             sys.exit(1)
         
-        # Filtrar archivos con o sin prefijo
-        current_files = [f for f in files if 
-                 (prefix and f.startswith(prefix) and current_start <= int(f[len(prefix):].split('.')[0]) <= current_end) or
-                 (not prefix and f.split('.')[0].isdigit() and current_start <= int(f.split('.')[0]) <= current_end)]
+        # Extraer el número de cada archivo y filtrar por rango en una sola pasada
+        pattern = re.compile(rf"^{re.escape(prefix or '')}(\d+)(?:\.|$)")
+        in_range = []
+        present_numbers = set()
+        for f in entries:
+            match = pattern.match(f)
+            if match:
+                number = int(match.group(1))
+                if current_start <= number <= current_end:
+                    in_range.append((number, f))
+                    present_numbers.add(number)
+        
+        # Única ordenación: solo los archivos del rango, por número (el nombre desempata)
+        current_files = [f for _, f in sorted(in_range)]
         
         log_action("Command: " + ' '.join(sys.argv))
         
@@ -525,13 +1041,14 @@ def rename_files(directory, prefix, current_start, current_end, new_start, dupli
         print(f"Files found in range: {len(current_files)}")
         print("="*60)
         
-        # Detectar archivos faltantes
-        missing_files = [f"{prefix or ''}{i}" for i in range(current_start, current_end + 1) 
-                         if not any(f.startswith(f"{prefix or ''}{i}.") for f in files)]
+        # Detectar archivos faltantes: los números del rango que no aparecieron
+        missing_files = [f"{prefix or ''}{i}" for i in range(current_start, current_end + 1)
+                         if i not in present_numbers]
 
         if missing_files:
-            print(f"\nWarning: The following files are missing: {', '.join(missing_files)}")
-            log_action(f"Warning: The following files are missing: {', '.join(missing_files)}")
+            warning = f"Warning: The following files are missing: {', '.join(missing_files)}"
+            print("\n" + warning)
+            log_action(warning)
             confirm = input("\nDo you want to continue renaming the available files? (Y/N): ")
             log_action(f"User selected: {confirm}")
 
@@ -543,12 +1060,15 @@ def rename_files(directory, prefix, current_start, current_end, new_start, dupli
         # Mostrar preview de cambios
         print("\nPREVIEW OF CHANGES:")
         print("-" * 50)
-        current_files.sort(key=lambda x: int(x[len(prefix or ''):].split('.')[0]))
         
-        for i, file in enumerate(current_files):
-            extension = os.path.splitext(file)[1]
-            new_filename = f"{prefix or ''}{new_start + i}{extension}"
-            print(f"  {file:<25} -> {new_filename}")
+        # Nombres nuevos calculados una sola vez para el preview y el renombrado
+        name_prefix = prefix or ''
+        new_filenames = [f"{name_prefix}{number}{os.path.splitext(file)[1]}"
+                         for number, file in enumerate(current_files, new_start)]
+        
+        # Construir el preview completo y escribirlo de una sola vez
+        sys.stdout.write("".join(f"  {file:<25} -> {new_filename}\n"
+                                 for file, new_filename in zip(current_files, new_filenames)))
         print("-" * 50)
         
         # Confirmar antes de proceder
@@ -559,31 +1079,44 @@ def rename_files(directory, prefix, current_start, current_end, new_start, dupli
         print("\nRENAMING IN PROGRESS...")
         print("-" * 50)
         
-        handler = DuplicateHandler(duplicate_strategy)
+        # JSON es legible; para lotes muy grandes pickle es bastante más rápido
+        if mapping_format is None:
+            mapping_format = "pickle" if len(current_files) > PICKLE_MAPPING_THRESHOLD else "json"
+        handler = DuplicateHandler(duplicate_strategy, mapping_format=mapping_format)
         files_renamed = 0
         files_skipped = 0
         
-        # Renombrar los archivos en orden inverso para evitar conflictos
-        for i, file in enumerate(reversed(current_files)):
-            old_path = os.path.join(directory, file)
-            extension = os.path.splitext(file)[1]
-            new_filename = f"{prefix or ''}{new_start + len(current_files) - 1 - i}{extension}"
-            new_path = os.path.join(directory, new_filename)
-            
-            print(f"\n  Processing: {file} -> {new_filename}")
-            
-            result_path = handler.handle_duplicate(old_path, new_path)
+        dir_prefix = os.path.join(directory, "")
+        # El progreso por archivo solo se muestra en terminal; el preview ya lo lista
+        show_progress = sys.stdout.isatty()
+        
+        # Renombrar los archivos (run_rename_plan evita los choques dentro del lote)
+        plan = []
+        for file, new_filename in zip(current_files, new_filenames):
+            message = f"\n  Processing: {file} -> {new_filename}" if show_progress else None
+            plan.append((entries[file].path, dir_prefix + new_filename, message))
+        
+        # Sin comprobación previa: el propio renombrado indica si falta permiso
+        try:
+            results = run_rename_plan(handler, plan,
+                                      {os.path.normcase(entry.path) for entry in entries.values()})
+        except PermissionError:
+            write_permission_error(directory)
+        
+        for file, new_filename, (old_path, new_path, _), result_path in zip(
+                current_files, new_filenames, plan, results):
             if result_path != old_path:
                 files_renamed += 1
-                log_action(f"Renamed: {file} -> {os.path.basename(result_path)}")
+                result_name = new_filename if result_path == new_path else os.path.basename(result_path)
+                log_action(f"Renamed: {file} -> {result_name}")
             else:
                 files_skipped += 1
 
         # Guardar operaciones para rollback
         print("-" * 50)
         
-        if handler.operations:
-            handler.save_operations(MAPPING_FILE)
+        if handler.operation_count:
+            handler.save_operations()
             print(f"\nOPERATION COMPLETED!")
             print(f"Summary:")
             print(f"   - Files renamed: {files_renamed}")
@@ -597,13 +1130,30 @@ def rename_files(directory, prefix, current_start, current_end, new_start, dupli
     except Exception as e:
         print(f"\nError: {e}")
         log_action(f"Rename error: {e}")
+    
+    finally:
+        # Cerrar el mapeo también si la operación se interrumpió a medias
+        if handler is not None:
+            handler.save_operations()
+        end_log_batch()
+
+
+def remove_empty_folders(path):
+    """Borra de abajo arriba las carpetas que estaban vacías al leerlas (incluida path)"""
+    with os.scandir(path) as it:
+        entries = list(it)
+    for entry in entries:
+        if entry.is_dir(follow_symlinks=False):
+            remove_empty_folders(entry.path)
+    if not entries:
+        os.rmdir(path)
 
 
 def rollback(directory):
     """Revierte TODAS las operaciones de forma interactiva por carpeta"""
+    begin_log_batch()
     try:
         directory = os.path.abspath(directory)
-        check_write_permissions(directory)
         
         # Verificar si existe el archivo de mapeo
         if not os.path.exists(MAPPING_FILE):
@@ -614,21 +1164,28 @@ def rollback(directory):
         log_action("Command: " + ' '.join(sys.argv))
         
         # Leer el archivo de mapeo
-        with open(MAPPING_FILE, "r") as f:
-            data = json.load(f)
-        
-        operations = [RenameOperation.from_dict(op) for op in data["operations"]]
+        timestamp, operations = DuplicateHandler.load_operations(MAPPING_FILE)
         
         if not operations:
             print("\nThe mapping file is empty. There is nothing to revert.")
             return
         
+        # Los pasos "temp" del renombrado en dos fases se deshacen sin mostrarse;
+        # se recuerda el nombre original detrás de cada nombre temporal
+        temp_origins = {}
+        for op in operations:
+            if op.operation_type == "temp" and op.old_path not in temp_origins:
+                temp_origins[op.new_path] = op.old_path
+        
+        def visible_count(ops):
+            return sum(1 for op in ops if op.operation_type != "temp")
+        
         print("\n" + "="*60)
         print("ROLLBACK OPERATION")
         print("="*60)
         print(f"Base directory: {directory}")
-        print(f"Total operations to revert: {len(operations)}")
-        print(f"Original operation time: {data['timestamp']}")
+        print(f"Total operations to revert: {visible_count(operations)}")
+        print(f"Original operation time: {timestamp}")
         print("="*60)
         
         if input("\nProceed with rollback? [Y/N]: ").lower() != 'y':
@@ -661,47 +1218,93 @@ def rollback(directory):
         def revert_folder_operations(folder_ops, folder_name):
             nonlocal total_successful, total_failed
             
-            print(f"\nReverting {len(folder_ops)} operation(s) in: {folder_name}")
+            print(f"\nReverting {visible_count(folder_ops)} operation(s) in: {folder_name}")
             print("-" * 50)
             
             successful = 0
             failed = 0
             
+            # Los nombres de la carpeta se leen una vez y se actualizan con cada
+            # renombrado; solo se pregunta al disco cuando el nombre no está.
+            # Como os.path.exists, los enlaces rotos no cuentan
+            folder = os.path.normcase(os.path.dirname(folder_ops[0].new_path))
+            try:
+                with os.scandir(folder) as it:
+                    present = {os.path.normcase(entry.name) for entry in it
+                               if not entry.is_symlink() or os.path.exists(entry.path)}
+            except OSError:
+                present = set()
+            
+            def folder_key(path):
+                """Nombre normalizado si path está en la carpeta, None si no"""
+                if present is None:
+                    return None
+                parent, name = os.path.split(path)
+                return os.path.normcase(name) if os.path.normcase(parent) == folder else None
+            
+            def exists(path):
+                nonlocal present
+                key = folder_key(path)
+                if key is not None and key in present:
+                    return True
+                if not os.path.exists(path):
+                    return False
+                if key is not None:
+                    # Existe con otro nombre equivalente (p. ej. otra capitalización en
+                    # un sistema de archivos sin distinción): el listado ya no sirve
+                    present = None
+                return True
+            
+            def move(src, dst, replace=False):
+                (os.replace if replace else os.rename)(src, dst)
+                key = folder_key(src)
+                if key is not None:
+                    present.discard(key)
+                key = folder_key(dst)
+                if key is not None:
+                    present.add(key)
+            
             for op in reversed(folder_ops):
+                new_name = os.path.basename(op.new_path)
+                old_name = os.path.basename(temp_origins.get(op.old_path, op.old_path))
                 try:
-                    if op.operation_type == "rename":
-                        if os.path.exists(op.new_path):
-                            os.rename(op.new_path, op.old_path)
-                            print(f"[OK] Reverted: {os.path.basename(op.new_path)} -> {os.path.basename(op.old_path)}")
+                    if op.operation_type == "temp":
+                        if exists(op.new_path):
+                            move(op.new_path, op.old_path)
+                    
+                    elif op.operation_type == "rename":
+                        if exists(op.new_path):
+                            move(op.new_path, op.old_path)
+                            print(f"[OK] Reverted: {new_name} -> {old_name}")
                             successful += 1
                         else:
-                            print(f"[SKIP] File not found: {os.path.basename(op.new_path)}")
+                            print(f"[SKIP] File not found: {new_name}")
                             failed += 1
                     
                     elif op.operation_type == "backup":
-                        if os.path.exists(op.new_path):
-                            os.rename(op.new_path, op.old_path)
-                            print(f"[OK] Reverted: {os.path.basename(op.new_path)} -> {os.path.basename(op.old_path)}")
+                        if exists(op.new_path):
+                            move(op.new_path, op.old_path)
+                            print(f"[OK] Reverted: {new_name} -> {old_name}")
                         
-                        if op.backup_path and os.path.exists(op.backup_path):
-                            shutil.move(op.backup_path, op.new_path)
-                            print(f"[OK] Restored from backup: {os.path.basename(op.new_path)}")
+                        if op.backup_path and exists(op.backup_path):
+                            move(op.backup_path, op.new_path, replace=True)
+                            print(f"[OK] Restored from backup: {new_name}")
                         
                         successful += 1
                     
                     elif op.operation_type == "overwrite":
-                        if os.path.exists(op.new_path):
-                            os.rename(op.new_path, op.old_path)
-                            print(f"[OK] Reverted: {os.path.basename(op.new_path)} -> {os.path.basename(op.old_path)}")
+                        if exists(op.new_path):
+                            move(op.new_path, op.old_path)
+                            print(f"[OK] Reverted: {new_name} -> {old_name}")
                         
-                        if op.backup_path and os.path.exists(op.backup_path):
-                            shutil.move(op.backup_path, op.new_path)
-                            print(f"[OK] Restored overwritten file: {os.path.basename(op.new_path)}")
+                        if op.backup_path and exists(op.backup_path):
+                            move(op.backup_path, op.new_path, replace=True)
+                            print(f"[OK] Restored overwritten file: {new_name}")
                         
                         successful += 1
                     
                 except Exception as e:
-                    print(f"[ERROR] Failed to revert {os.path.basename(op.new_path)}: {e}")
+                    print(f"[ERROR] Failed to revert {new_name}: {e}")
                     failed += 1
                     log_action(f"Error during rollback: {e}")
             
@@ -726,7 +1329,7 @@ def rollback(directory):
             for i, (folder_path, ops) in enumerate(subfolder_ops.items(), 1):
                 rel_path = os.path.relpath(folder_path, directory)
                 subfolders_list.append((folder_path, ops, rel_path))
-                print(f"  {i}. {rel_path} ({len(ops)} operations)")
+                print(f"  {i}. {rel_path} ({visible_count(ops)} operations)")
             
             choice = input("\nDo you want to revert changes in subfolders? [Y/N]: ").strip().lower()
             
@@ -765,9 +1368,7 @@ def rollback(directory):
         backup_dir = os.path.join(directory, ".rename_backups")
         if os.path.exists(backup_dir):
             try:
-                for root, dirs, files in os.walk(backup_dir, topdown=False):
-                    if not files and not dirs:
-                        os.rmdir(root)
+                remove_empty_folders(backup_dir)
                 print("[OK] Cleaned up backup directories")
             except:
                 pass
@@ -787,14 +1388,63 @@ def rollback(directory):
     except Exception as e:
         print(f"\nRollback error: {e}")
         log_action(f"Rollback error: {e}")
+    
+    finally:
+        end_log_batch()
 
 
-if __name__ == "__main__":
-    # Custom description with better formatting
-    description = """Batch file renaming tool with rollback functionality – efficient, simple, and powerful.
+# Command line fast path: the usual options are parsed without building
+# (or even importing) argparse, which is only used for anything unusual
+_FAST_FLAGS = frozenset(('-h', '--help', '-v', '--version', '-u', '--update'))
+_CLI_SWITCHES = {'-a': 'all', '--all': 'all', '-r': 'rollback', '--rollback': 'rollback'}
+_CLI_OPTIONS = {
+    '-l': 'location', '--location': 'location',
+    '-p': 'prefix', '--prefix': 'prefix',
+    '-cs': 'current_start', '--current-start': 'current_start',
+    '-ce': 'current_end', '--current-end': 'current_end',
+    '-ns': 'new_start', '--new-start': 'new_start',
+    '-ds': 'duplicate_strategy', '--duplicate-strategy': 'duplicate_strategy',
+    '-mf': 'mapping_format', '--mapping-format': 'mapping_format',
+}
+_CLI_INT_OPTIONS = frozenset(('current_start', 'current_end', 'new_start'))
+_CLI_CHOICES = {'duplicate_strategy': DUPLICATE_STRATEGIES, 'mapping_format': MAPPING_FORMATS}
 
-Rename multiple files with custom prefixes and numbering, handle duplicates intelligently,
-and rollback changes when needed. Perfect for organizing photos, documents, and any file collections."""
+
+def fast_parse_args(argv):
+    """Parse the common command lines in a single pass over argv.
+    
+    Returns the same attributes as build_parser().parse_args(), or None when
+    argv has anything unusual (unknown or abbreviated options, --opt=value,
+    invalid values...) so argparse can parse it and report errors.
+    """
+    args = types.SimpleNamespace(help=False, location=None, prefix=None, all=False,
+                                 current_start=None, current_end=None, new_start=None,
+                                 rollback=False, duplicate_strategy='ask', mapping_format=None)
+    tokens = iter(argv)
+    for token in tokens:
+        switch = _CLI_SWITCHES.get(token)
+        if switch:
+            setattr(args, switch, True)
+            continue
+        
+        dest = _CLI_OPTIONS.get(token)
+        value = next(tokens, None)
+        if dest is None or value is None or value.startswith('-'):
+            return None
+        if dest in _CLI_INT_OPTIONS:
+            try:
+                value = int(value)
+            except ValueError:
+                return None
+        elif dest in _CLI_CHOICES and value not in _CLI_CHOICES[dest]:
+            return None
+        setattr(args, dest, value)
+    return args
+
+
+def build_parser(description):
+    """Build the full argparse parser (slow path and help on errors)"""
+    import argparse
     
     parser = argparse.ArgumentParser(
         description=description,
@@ -811,44 +1461,40 @@ and rollback changes when needed. Perfect for organizing photos, documents, and
     parser.add_argument("-ns", "--new-start", type=int, help="New start point for renaming.")
     parser.add_argument("-r", "--rollback", action="store_true", help="Revert last renaming operation.")
     parser.add_argument("-ds", "--duplicate-strategy", 
-                       choices=['skip', 'suffix', 'backup', 'overwrite', 'ask'],
+                       choices=DUPLICATE_STRATEGIES,
                        default='ask',
                        help="How to handle duplicate filenames (default: ask)")
+    parser.add_argument("-mf", "--mapping-format", choices=MAPPING_FORMATS,
+                       help="Format of the rollback mapping file (default: json, pickle for large batches)")
+    return parser
+
+
+if __name__ == "__main__":
+    # Custom description with better formatting
+    description = """Batch file renaming tool with rollback functionality – efficient, simple, and powerful.
+
+Rename multiple files with custom prefixes and numbering, handle duplicates intelligently,
+and rollback changes when needed. Perfect for organizing photos, documents, and any file collections."""
     
     # Handle special arguments first
-    if len(sys.argv) == 1 or '--help' in sys.argv or '-h' in sys.argv:
-        print(BANNER)
-        print("\n" + description + "\n")
-        print("Usage: r3namex.py [-h] [-v] [-u] [-l LOCATION] [-p PREFIX] [-a] [-cs CURRENT_START]")
-        print("                  [-ce CURRENT_END] [-ns NEW_START] [-r]")
-        print("                  [-ds {skip,suffix,backup,overwrite,ask}]\n")
-        print("Options:")
-        print("  -h, --help            Show this help message and exit")
-        print("  -v, --version         Show version information")
-        print("  -u, --update          Check for updates")
-        print("  -l, --location        Folder where files are located")
-        print("  -p, --prefix          Prefix of files (optional)")
-        print("  -a, --all             Interactive rename for all files in directory and subfolders")
-        print("  -cs, --current-start  Start of current range")
-        print("  -ce, --current-end    End of current range")
-        print("  -ns, --new-start      New start point for renaming")
-        print("  -r, --rollback        Revert last renaming operation")
-        print("  -ds, --duplicate-strategy")
-        print("                        How to handle duplicate filenames (default: ask)")
-        print("                        Choices: skip, suffix, backup, overwrite, ask")
-        print(EXAMPLES)
+    fast_flags = _FAST_FLAGS.intersection(sys.argv[1:])
+    if len(sys.argv) == 1 or fast_flags & {'-h', '--help'}:
+        sys.stdout.write(get_help_text(description))
         sys.exit(0)
     
-    if '--version' in sys.argv or '-v' in sys.argv:
+    if fast_flags & {'-v', '--version'}:
         show_version()
         sys.exit(0)
     
-    if '--update' in sys.argv or '-u' in sys.argv:
+    if fast_flags & {'-u', '--update'}:
         check_for_updates()
         sys.exit(0)
     
     try:
-        args = parser.parse_args()
+        # The full argparse parser is only built for unusual command lines
+        args = fast_parse_args(sys.argv[1:])
+        if args is None:
+            args = build_parser(description).parse_args()
 
         # Nueva lógica para el renombrado interactivo
         if args.all:
@@ -856,7 +1502,8 @@ and rollback changes when needed. Perfect for organizing photos, documents, and
                 args.location = input("Enter the path to the folder where the files are located: ").strip()
             prefix = args.prefix or "File"
             start_number = args.new_start if args.new_start else 1
-            rename_all_files_interactive(args.location, prefix, start_number, args.duplicate_strategy)
+            rename_all_files_interactive(args.location, prefix, start_number, args.duplicate_strategy,
+                                         args.mapping_format)
             sys.exit(0)  
  
         # Preguntar por la ruta si no se proporciona
@@ -884,13 +1531,9 @@ and rollback changes when needed. Perfect for organizing photos, documents, and
 
         # Ejecutar renumerado
         rename_files(args.location, args.prefix, args.current_start, args.current_end, 
-                    args.new_start, args.duplicate_strategy)
-
-    except argparse.ArgumentError as e:
-        print(f"Arguments error: {e}")
-        parser.print_help()
+                    args.new_start, args.duplicate_strategy, args.mapping_format)
 
     except Exception as ex:
         print(f"Error: {ex}")
         log_action(f"Error: {ex}")
-        parser.print_help()
+        build_parser(description).print_help()